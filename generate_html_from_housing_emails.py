@@ -9,7 +9,9 @@ The script uses the following libraries:
     - imaplib: For interacting with the Gmail IMAP server.
     - email: For parsing email messages.
     - pandas: For data manipulation and analysis.
-    - beautifulsoup4: For parsing and manipulating HTML content.
+    - selectolax: For parsing and manipulating HTML content.
+    - tqdm: For parse progress bars.
+    - beautifulsoup4 + lxml: Fallback HTML parser.
 
 Ensure you have the necessary libraries installed and that your email credentials
 are correctly configured in the `creds.py` file.
@@ -17,17 +19,35 @@ are correctly configured in the `creds.py` file.
 
 
 import time
+import datetime
+import hashlib
 import os
-from typing import List, Dict
+import json
+import multiprocessing
+import queue
+import re
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Iterator, List, Dict, Optional, Tuple
 import pandas as pd
 
 import email
 import email.message
+import email.parser
+import email.policy
+import email.utils
 import imaplib
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from selectolax.lexbor import LexborHTMLParser
+from tqdm import tqdm
 from creds import EMAIL_ADDRESS, EMAIL_PASSWORD
 
 
+IMAP_HOST = 'imap.gmail.com'
+IMAP_TIMEOUT = 30  # Seconds before a stalled IMAP socket operation fails
+IMAP_RETRIES = 3  # Retries of a failed IMAP command, with exponential backoff
+
 # Constants for allowed email addresses
 TO_ALLOWED = ['seattle.housing.feed@gmail.com']
 FROM_ALLOWED = [
@@ -37,64 +57,90 @@ FROM_ALLOWED = [
     '"Redfin" <redmail@redfin.com>'
 ]
 
+# CSS selectors of unwanted elements to remove, by sender and for all emails
+SENDER_SPECIFIC_REMOVALS = types.MappingProxyType({
+    'listings@redfin.com': ('.footer-layout-wrapper',),
+    'redmail@redfin.com': ('footer', '.footer'),
+    'daily-updates@mail.zillow.com': ('address',),
+    'open-houses@mail.zillow.com': ('address', '.dmTxtLinkSecondary'),
+})
+# Inline base64 images are usually repeated template graphics that bloat every
+# page, while real listing photos are remote <img src=...> links
+COMMON_REMOVALS = ('script', 'style', 'img[src^="data:"]')
+# The removals of each sender as one selector group, matched in a single query
+_REMOVAL_SELECTORS = types.MappingProxyType({
+    sender: ', '.join(removals + COMMON_REMOVALS)
+    for sender, removals in SENDER_SPECIFIC_REMOVALS.items()
+})
+_COMMON_REMOVAL_SELECTOR = ', '.join(COMMON_REMOVALS)
+
+# Number of messages requested per IMAP FETCH command. Smaller batches pay
+# more per-command latency, and the comma-joined UID set of each command must
+# stay under the server's request size limit
+FETCH_BATCH_SIZE = 100
+FETCH_MAX_UID_SET_BYTES = 900
+# Number of fetched batches buffered ahead of the parser
+PREFETCH_BATCHES = 2
+
 # Pagination configuration
 N_ENTRIES_PER_HTML = 100
-
-# Save .tsv of the scraped df (same info as in html)
-SAVE_DEBUG_CACHE = False
-LOAD_DEBUG_CACHE = False
-EMAIL_CACHE_FILE = '.email_cache.tsv'
+# Content hash of each written page, so unchanged pages aren't rewritten
+PAGE_HASHES_FILE = '.email_pages.json'
+
+# Cache the scraped df (same info as in html, keyed by IMAP UID) along with the
+# UID it was synced up to, so later runs only fetch newer messages
+USE_EMAIL_CACHE = True
+FORCE_FETCH_ALL = False  # Re-fetch the whole inbox, ignoring the cache
+LOAD_DEBUG_CACHE = False  # Only render the cache, without fetching new mail
+EMAIL_CACHE_FILE = '.email_cache.parquet'
+EMAIL_SYNC_STATE_FILE = '.email_cache.json'
+LEGACY_EMAIL_CACHE_FILE = '.email_cache.tsv'
+
+_UID_RE = re.compile(rb'UID (\d+)')
+# Errors after which an IMAP connection is unusable (OSError covers timeouts)
+_IMAP_CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError)
+# Skips building the <head> in the BeautifulSoup fallback of `clean_html`
+_BODY_STRAINER = SoupStrainer('body')
+# Decodes bodies with their declared charset, see `parse_housing_email_message`
+_EMAIL_PARSER = email.parser.BytesParser(policy=email.policy.default)
+# Parses the From/To prefilter headers without setting up any body parsing
+_HEADER_PARSER = email.parser.BytesHeaderParser()
 
 
 def save_emails_to_html(
-    emails: pd.DataFrame,
+    emails_html: Iterable[str],
     html_filepath: str,
     header: str,
     footer: str = None,
     encoding: str = 'utf-8',
 ):
-  """Saves a DataFrame of email data to an HTML file.
+  """Saves the HTML content of emails to an HTML file.
 
   Args:
-      emails: DataFrame containing email data, including an 'html' column with
-        HTML content.
+      emails_html: The HTML content of each email, in page order.
       html_filepath: Path to the output HTML file.
       encoding: Character encoding to use. Defaults to 'utf-8'.
   """
   if not footer:  # Use header as footer.
     footer = header
 
-  with open(html_filepath, 'w', encoding=encoding) as file:
-    # Concatenate first, then encode/decode for efficiency
-    html_content = (
-        emails['html']
-        .str.cat(sep='\n')
-        .encode(encoding, 'replace')
-        .decode(encoding)
-    )
-    file.write(header + html_content + footer)
-
-
-def _html_header(cur_page: int, n_pages: int) -> str:
-  """Returns the HTML header with embedded styles and page buttons.
-
-  Args:
-      cur_page: The index of the current page.
-      n_pages: The total number of pages.
-
-  Returns:
-      The HTML header string.
-  """
-  first_page = ''  # dont append 0 to index
-  last_page = n_pages - 1
-  prev_page = cur_page - 1
-  next_page = cur_page + 1
-  if cur_page == 0:
-    prev_page = ''
-  elif cur_page == last_page:
-    next_page = ''
-
-  return f"""
+  # Unencodable characters are replaced by the file while writing, and the
+  # 1 MB buffer batches the many small per-email writes
+  with open(
+      html_filepath, 'w', encoding=encoding, errors='replace',
+      buffering=1 << 20,
+  ) as file:
+    file.write(header)
+    # Stream each email instead of concatenating the whole page in memory
+    for i, html in enumerate(emails_html):
+      if i:
+        file.write('\n')
+      file.write(html)
+    file.write(footer)
+
+
+# Page header, formatted with the page links by `_html_header`
+_HTML_HEADER_TEMPLATE = """
     <head>
     <title>Seattle Housing Inbox</title>
     <style>
@@ -132,9 +178,173 @@ def _html_header(cur_page: int, n_pages: int) -> str:
     """
 
 
+def _page_hash(emails_html: Iterable[str], header: str) -> str:
+  """Returns a hash of the content `save_emails_to_html` would write."""
+  page_hash = hashlib.blake2b(header.encode('utf-8', 'replace'), digest_size=16)
+  for html in emails_html:
+    page_hash.update(b'\n')
+    page_hash.update(html.encode('utf-8', 'replace'))
+  return page_hash.hexdigest()
+
+
+def _html_header(cur_page: int, n_pages: int) -> str:
+  """Returns the HTML header with embedded styles and page buttons.
+
+  Args:
+      cur_page: The index of the current page.
+      n_pages: The total number of pages.
+
+  Returns:
+      The HTML header string.
+  """
+  first_page = ''  # dont append 0 to index
+  last_page = n_pages - 1
+  prev_page = cur_page - 1
+  next_page = cur_page + 1
+  if cur_page == 0:
+    prev_page = ''
+  elif cur_page == last_page:
+    next_page = ''
+
+  return _HTML_HEADER_TEMPLATE.format_map({
+      'first_page': first_page,
+      'prev_page': prev_page,
+      'next_page': next_page,
+      'last_page': last_page,
+  })
+
+
+def _fetch_responses(msg_data: list) -> Iterator[Tuple[bytes, bytes]]:
+  """Yields (UID, payload) pairs from an IMAP UID FETCH response.
+
+  Args:
+      msg_data: The data returned by `imaplib.IMAP4.uid('FETCH', ...)`, a mix
+        of (envelope, payload) tuples and closing b')' separators.
+  """
+  for item in msg_data:
+    if isinstance(item, tuple):
+      yield _UID_RE.search(item[0]).group(1), item[1]
+
+
+def _gmail_search_query(from_allowed: List[str], to_allowed: List[str]) -> str:
+  """Returns a quoted X-GM-RAW search matching any allowed sender and recipient.
+
+  Args:
+      from_allowed: List of allowed sender email addresses.
+      to_allowed: List of allowed recipient email addresses.
+  """
+  senders = ' OR '.join(email.utils.parseaddr(a)[1] for a in from_allowed)
+  recipients = ' OR '.join(email.utils.parseaddr(a)[1] for a in to_allowed)
+  return f'"from:({senders}) to:({recipients})"'
+
+
+def _uid_batches(uids: List[bytes]) -> Iterator[List[bytes]]:
+  """Splits UIDs into FETCH batches capped by count and UID set size.
+
+  Args:
+      uids: The UIDs to fetch, in order.
+
+  Yields:
+      Lists of at most FETCH_BATCH_SIZE UIDs whose comma-joined UID set is at
+      most FETCH_MAX_UID_SET_BYTES long.
+  """
+  batch, batch_bytes = [], 0
+  for uid in uids:
+    uid_bytes = len(uid) + 1  # Including the comma separator
+    if batch and (len(batch) == FETCH_BATCH_SIZE
+                  or batch_bytes + uid_bytes > FETCH_MAX_UID_SET_BYTES):
+      yield batch
+      batch, batch_bytes = [], 0
+    batch.append(uid)
+    batch_bytes += uid_bytes
+  if batch:
+    yield batch
+
+
+class ImapSession:
+  """A logged in IMAP connection that reconnects when it stalls or drops.
+
+  Connects on first use and logs out when the `with` block exits. Commands
+  that stall or drop the connection are retried on a fresh one, with the
+  mailbox selected again.
+  """
+
+  def __init__(self, host: str, username: str, password: str):
+    self.host = host
+    self.username = username
+    self._password = password
+    self._mail = None
+    self._mailbox = None
+
+  def _connection(self) -> imaplib.IMAP4:
+    """Returns the live connection, connecting if there is none."""
+    if self._mail is None:
+      self._mail = imaplib.IMAP4_SSL(self.host, timeout=IMAP_TIMEOUT)
+      self._mail.login(self.username, self._password)
+      if self._mailbox:
+        self._mail.select(self._mailbox, readonly=True)
+    return self._mail
+
+  def select(self, mailbox: str) -> int:
+    """Selects a mailbox read-only, so fetching never marks mail as \\Seen.
+
+    Args:
+        mailbox: The mailbox to select.
+
+    Returns:
+        The UIDVALIDITY of the mailbox.
+    """
+    mail = self._connection()
+    mail.select(mailbox, readonly=True)
+    self._mailbox = mailbox
+    _, [uidvalidity] = mail.response('UIDVALIDITY')
+    return int(uidvalidity)
+
+  def uid(self, command: str, *args) -> list:
+    """Runs an IMAP UID command, retrying with backoff on connection errors.
+
+    Args:
+        command: The UID command, e.g. 'SEARCH' or 'FETCH'.
+        *args: The command arguments.
+
+    Returns:
+        The response data of the command.
+    """
+    for attempt in range(IMAP_RETRIES + 1):
+      try:
+        _, data = self._connection().uid(command, *args)
+        return data
+      except _IMAP_CONNECTION_ERRORS as e:
+        if attempt == IMAP_RETRIES:
+          raise
+        delay = 2 ** (attempt + 1)
+        print(f'Warning: IMAP {command} failed ({e!r}), retrying in {delay}s')
+        self._mail = None
+        time.sleep(delay)
+
+  def close(self) -> None:
+    """Logs out of the connection, if any."""
+    if self._mail is not None:
+      try:
+        self._mail.logout()
+      except _IMAP_CONNECTION_ERRORS:
+        pass  # Already dropped by the server
+      self._mail = None
+
+  def __enter__(self) -> 'ImapSession':
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> None:
+    self.close()
+
+
 def fetch_email_messages(
-    username: str, password: str, from_allowed: List[str], to_allowed: List[str]
-) -> List[email.message.Message]:
+    username: str,
+    password: str,
+    from_allowed: List[str],
+    to_allowed: List[str],
+    sync_state: Optional[Dict[str, int]] = None,
+) -> Iterator[List[Tuple[bytes, bytes]]]:
   """Fetches email messages from inbox based on sender and recipient criteria.
 
   Args:
@@ -142,44 +352,172 @@ def fetch_email_messages(
       password: Email password for login.
       from_allowed: List of allowed sender email addresses.
       to_allowed: List of allowed recipient email addresses.
+      sync_state: Incremental sync state holding the inbox 'uidvalidity' and
+        the 'last_uid' already fetched. Only messages with a greater UID are
+        fetched, and the state is updated in place as batches are fetched. If
+        the inbox UIDVALIDITY changed, the whole inbox is fetched again.
+
+  Yields:
+      Batches of (UID, raw RFC822 email) pairs for the messages that meet the
+      criteria, as they are fetched.
+  """
+  with ImapSession(IMAP_HOST, username, password) as session:
+    yield from _fetch_allowed_batches(
+        session, from_allowed, to_allowed,
+        {} if sync_state is None else sync_state,
+    )
+
+
+def _fetch_allowed_batches(
+    session: ImapSession,
+    from_allowed: List[str],
+    to_allowed: List[str],
+    sync_state: Dict[str, int],
+) -> Iterator[List[Tuple[bytes, bytes]]]:
+  """Yields allowed (UID, raw email) batches from an IMAP session."""
+  uidvalidity = session.select('inbox')
+  if sync_state.get('uidvalidity') != uidvalidity:
+    # Either a first sync or the server reassigned all UIDs
+    sync_state.update(uidvalidity=uidvalidity, last_uid=0)
+  last_uid = sync_state['last_uid']
+
+  # Let Gmail filter on the allowed addresses so unrelated mail is never
+  # fetched, the exact From/To values are still checked below
+  criteria = [f'UID {last_uid + 1}:*'] if last_uid else []
+  data = session.uid(
+      'SEARCH', *criteria,
+      'X-GM-RAW', _gmail_search_query(from_allowed, to_allowed))
+  # "UID n:*" always matches the newest message, even if its UID is below n
+  uids = sorted(
+      (uid for uid in data[0].split() if int(uid) > last_uid), key=int)
+
+  for uid_batch in _uid_batches(uids):
+    # Filter on the From/To headers first so only allowed bodies are fetched
+    header_data = session.uid(
+        'FETCH', b','.join(uid_batch), '(BODY.PEEK[HEADER.FIELDS (FROM TO)])')
+    allowed_uids = []
+    for uid, raw_headers in _fetch_responses(header_data):
+      headers = _HEADER_PARSER.parsebytes(raw_headers)
+      if headers['From'] not in from_allowed:
+        print(
+            'Skipping email not in from_allow_list,',
+            f"From: {headers['From']}")
+        continue
+      if headers['To'] not in to_allowed:
+        print(
+            'Skipping email not in to_allow_list,',
+            f"To: {headers['To']}")
+        continue
+      allowed_uids.append(uid)
+    sync_state['last_uid'] = int(uid_batch[-1])
+
+    if not allowed_uids:
+      continue
+    msg_data = session.uid('FETCH', b','.join(allowed_uids), '(RFC822)')
+    yield list(_fetch_responses(msg_data))
+
+
+def _iter_in_background(items: Iterable, maxsize: int) -> Iterator:
+  """Consumes an iterable in a background thread and yields its items.
+
+  Lets the producer (e.g. IMAP fetches) run ahead of the consumer by up to
+  `maxsize` items, so network waits overlap with parsing.
+
+  Args:
+      items: The iterable to consume.
+      maxsize: Maximum number of items buffered ahead of the consumer.
+
+  Yields:
+      The items of `items`, in order. Exceptions raised by the producer are
+      re-raised in the consumer.
+  """
+  buffer = queue.Queue(maxsize=maxsize)
+
+  def produce():
+    try:
+      for item in items:
+        buffer.put((item, None))
+    except Exception as e:  # pylint: disable=broad-except
+      buffer.put((None, e))
+    buffer.put(None)  # Done sentinel.
+
+  threading.Thread(target=produce, daemon=True).start()
+  while (entry := buffer.get()) is not None:
+    item, error = entry
+    if error:
+      raise error
+    yield item
+
+
+def clean_html(content: str, selector: str) -> str:
+  """Removes all elements matching a CSS selector from an HTML document.
+
+  Parses with selectolax (lexbor) and falls back to BeautifulSoup + lxml if
+  lexbor fails on malformed HTML.
+
+  Args:
+      content: The raw HTML content.
+      selector: CSS selector (or selector group) of the elements to remove.
 
   Returns:
-      A list of email messages that meet the criteria.
+      The cleaned HTML of the <body> element, as the <head> of an email only
+      holds metadata and styles.
   """
-  mail = imaplib.IMAP4_SSL('imap.gmail.com')
-  mail.login(username, password)
-  mail.select('inbox')
-  _, data = mail.search(None, 'ALL')
-
-  email_messages = []
-  for num in data[0].split():
-    _, msg_data = mail.fetch(num, '(RFC822)')
-    email_message = email.message_from_bytes(msg_data[0][1])
-
-    # Simplified filtering logic with early return
-    if email_message['From'] not in from_allowed:
-      print(
-          'Skipping email not in from_allow_list,',
-          f"From: {email_message['From']}")
-      continue
-    if email_message['To'] not in to_allowed:
-      print(
-          'Skipping email not in to_allow_list,',
-          f"To: {email_message['To']}")
-      continue
-    email_messages.append(email_message)
+  try:
+    tree = LexborHTMLParser(content)
+    # Only unlink, as matches may be nested inside already removed matches
+    for node in tree.css(selector):
+      node.remove()
+    return tree.body.html
+  except Exception as e:  # pylint: disable=broad-except
+    print(f'Warning: selectolax failed ({e}), falling back to BeautifulSoup.')
+
+  soup = BeautifulSoup(content, 'lxml', parse_only=_BODY_STRAINER)
+  for item in soup.select(selector):
+    item.decompose()
+  # The strained soup has no <html> element, just the <body>
+  return str(soup)
+
+
+def _email_datetime(
+    email_message: email.message.EmailMessage,
+) -> Optional[datetime.datetime]:
+  """Returns the Date of an email, or when it was received if it's malformed.
 
-  mail.logout()
-  return email_messages
+  Args:
+      email_message: An email parsed with `email.policy.default`.
+
+  Returns:
+      The date of the email, or None if neither it nor the date of the topmost
+      Received header (its delivery to this inbox) can be parsed.
+  """
+  # The email policy already parses the Date header
+  date = email_message['Date']
+  if date is not None and date.datetime is not None:
+    return date.datetime
+  received = email_message['Received']
+  if received is not None:
+    try:
+      received_date = email.utils.parsedate_to_datetime(
+          str(received).rpartition(';')[2].strip())
+      print(
+          f"Warning: Unable to parse 'Date' field: {date},",
+          f'using the received date {received_date}')
+      return received_date
+    except (TypeError, ValueError):
+      pass
+  print(f"Warning: Unable to parse 'Date' field: {date}")
+  return None
 
 
 def parse_housing_email_message(
-    email_message: email.message.Message,
-) -> Dict[str, str]:
+    email_message: email.message.EmailMessage,
+) -> Dict[str, Any]:
   """Parses a single email message, extracts info, and cleans HTML content.
 
   Args:
-      email_message: An email message object.
+      email_message: An email message object, parsed with
+        `email.policy.default`.
 
   Returns:
       A dictionary containing parsed email data, including cleaned HTML content.
@@ -189,7 +527,7 @@ def parse_housing_email_message(
       'Subject': email_message['Subject'],
       'To': email_message['To'],
       'From': email_message['From'],
-      'Date': email_message['Date'],
+      'Date': _email_datetime(email_message),
   }
 
   # Parse sender's name and email
@@ -200,37 +538,33 @@ def parse_housing_email_message(
   except ValueError:
     print(f"Warning: Unable to parse 'From' field: {email_message['From']}")
 
-  # Extract email content
+  # Extract email content, preferring the HTML body over the plain text one
+  body = email_message.get_body(preferencelist=('html', 'plain'))
   content = ''
-  for part in email_message.walk():
-    if part.get_content_type() in ('text/plain', 'text/html'):
-      try:
-        content += part.get_payload(decode=True).decode('UTF-8')
-      except UnicodeDecodeError:
-        print('Warning: Encoding issue, trying alternative decoding.')
-        content += part.get_payload(decode=True).decode('latin-1')
+  if body:
+    try:
+      content = body.get_content()
+    except (LookupError, UnicodeDecodeError):  # Unknown or wrong charset
+      content = body.get_payload(decode=True).decode('utf-8', 'replace')
 
   # Clean up HTML content
-  soup = BeautifulSoup(content, 'html.parser')
-
-  # Remove unwanted elements based on sender
-  sender_specific_removals = {
-      'listings@redfin.com': ('.footer-layout-wrapper',),
-      'redmail@redfin.com': ('footer',),
-      'daily-updates@mail.zillow.com': ('address',),
-      'open-houses@mail.zillow.com': ('address', '.dmTxtLinkSecondary'),
-  }
+  selector = _REMOVAL_SELECTORS.get(email_res['From'], _COMMON_REMOVAL_SELECTOR)
+  email_res['html'] = clean_html(content, selector)
+  return email_res
 
-  sender = email_res['From']
-  if sender in sender_specific_removals:
-    for element in sender_specific_removals[sender]:
-      for item in soup.find_all(class_=element):
-        item.extract()
 
-  # Remove common unwanted elements
-  for tag in soup.find_all(['script', 'style']):
-    tag.decompose()
-  email_res['html'] = str(soup.html)
+def parse_housing_email_message_bytes(
+    uid: bytes, raw_email: bytes) -> Dict[str, Any]:
+  """Parses a raw RFC822 email, see `parse_housing_email_message`.
+
+  Raw bytes are cheaper to send to worker processes than pickled messages.
+
+  Args:
+      uid: The IMAP UID of the email, added to the result as 'UID'.
+      raw_email: The raw RFC822 email.
+  """
+  email_res = parse_housing_email_message(_EMAIL_PARSER.parsebytes(raw_email))
+  email_res['UID'] = int(uid)
   return email_res
 
 
@@ -244,64 +578,184 @@ def format_email_df(emails: pd.DataFrame) -> pd.DataFrame:
       pd.DataFrame: The formatted DataFrame with added 'title' column and sorted
       by date.
   """
-  emails['Date'] = pd.to_datetime(
-      emails['Date'], format='%a, %d %b %Y %H:%M:%S %z'
-  )
-  emails['title'] = (
-      '<p style="text-align:center;">'
-      + '<b>'
-      + emails['Date'].astype(str)
-      + '  :  '
-      + emails['From']
-      + '</b></p>'
-  )
+  # One formatted string per row, instead of a new Series per concatenation.
+  # Titles show each email's own UTC offset, while the column is converted to
+  # UTC (from datetimes, no string parsing) so mixed offsets sort and cache
+  emails['title'] = [
+      f'<p style="text-align:center;"><b>{date}  :  {sender}</b></p>'
+      if not pd.isna(date)  # Undated emails only show their sender
+      else f'<p style="text-align:center;"><b>{sender}</b></p>'
+      for date, sender in zip(emails['Date'], emails['From'])
+  ]
+  emails['Date'] = pd.to_datetime(emails['Date'], utc=True)
   emails['html'] = emails['title'] + emails['html']
   return emails
 
 
+def _migrate_legacy_email_cache() -> None:
+  """Converts a legacy .tsv email cache to parquet if only the .tsv exists."""
+  if (os.path.exists(EMAIL_CACHE_FILE)
+      or not os.path.exists(LEGACY_EMAIL_CACHE_FILE)):
+    return
+  print(
+      f'Migrating email cache: {LEGACY_EMAIL_CACHE_FILE} -> {EMAIL_CACHE_FILE}')
+  emails = pd.read_csv(LEGACY_EMAIL_CACHE_FILE, sep='\t', index_col=0)
+  emails.to_parquet(EMAIL_CACHE_FILE, compression='zstd', index=True)
+  os.remove(LEGACY_EMAIL_CACHE_FILE)
+
+
+def _load_email_cache() -> Tuple[Optional[pd.DataFrame], Dict[str, int]]:
+  """Loads the cached emails and the IMAP sync state they were synced up to.
+
+  Returns:
+      The cached emails (None if there is no cache) and the sync state (empty
+      if it is missing).
+  """
+  _migrate_legacy_email_cache()
+  if not os.path.exists(EMAIL_CACHE_FILE):
+    return None, {}
+  print(f'Loading email cache: {EMAIL_CACHE_FILE}')
+  emails = pd.read_parquet(EMAIL_CACHE_FILE)
+  sync_state = {}
+  if os.path.exists(EMAIL_SYNC_STATE_FILE):
+    with open(EMAIL_SYNC_STATE_FILE, encoding='utf-8') as file:
+      sync_state = json.load(file)
+  return emails, sync_state
+
+
+def _save_email_cache(
+    emails: Optional[pd.DataFrame], sync_state: Dict[str, int]):
+  """Saves the IMAP sync state and the emails synced up to it.
+
+  Args:
+      emails: The emails to cache, or None to keep the cached emails as they
+        are. If empty, the cached emails are removed.
+      sync_state: The IMAP sync state, see `fetch_email_messages`.
+  """
+  if emails is not None and emails.empty:
+    if os.path.exists(EMAIL_CACHE_FILE):
+      os.remove(EMAIL_CACHE_FILE)
+  elif emails is not None:
+    print(f'Saving email cache: {EMAIL_CACHE_FILE}')
+    emails.to_parquet(EMAIL_CACHE_FILE, compression='zstd', index=True)
+  with open(EMAIL_SYNC_STATE_FILE, 'w', encoding='utf-8') as file:
+    json.dump(sync_state, file)
+
+
+def _load_page_hashes() -> Dict[str, str]:
+  """Loads the content hashes of the written pages, by file name."""
+  if not os.path.exists(PAGE_HASHES_FILE):
+    return {}
+  with open(PAGE_HASHES_FILE, encoding='utf-8') as file:
+    return json.load(file)
+
+
+def _save_page_hashes(page_hashes: Dict[str, str]) -> None:
+  """Saves the content hashes of the written pages, by file name."""
+  with open(PAGE_HASHES_FILE, 'w', encoding='utf-8') as file:
+    json.dump(page_hashes, file)
+
+
 def run_email_scraper() -> None:
   """Fetches, parses, and saves housing-related emails to an HTML file."""
   print('Scraping emails to html...', flush=True)
   t0 = time.time()
-  if LOAD_DEBUG_CACHE and os.path.exists(EMAIL_CACHE_FILE):
-    print(f'Loading email cache: {EMAIL_CACHE_FILE}')
-    emails = pd.read_csv(EMAIL_CACHE_FILE, sep='\t',  index_col=0)
+  cached_emails, sync_state = None, {}
+  if (USE_EMAIL_CACHE and not FORCE_FETCH_ALL) or LOAD_DEBUG_CACHE:
+    cached_emails, sync_state = _load_email_cache()
+
+  if LOAD_DEBUG_CACHE and cached_emails is not None:
+    emails = cached_emails
   else:
-    housing_emails = fetch_email_messages(
-        EMAIL_ADDRESS, EMAIL_PASSWORD, FROM_ALLOWED, TO_ALLOWED
+    if not sync_state:  # Unknown which UIDs are cached, so sync them all
+      cached_emails = None
+    cached_uidvalidity = sync_state.get('uidvalidity')
+
+    # Parse each batch while the next one is being fetched
+    housing_emails_batches = _iter_in_background(
+        fetch_email_messages(
+            EMAIL_ADDRESS, EMAIL_PASSWORD, FROM_ALLOWED, TO_ALLOWED,
+            sync_state,
+        ),
+        maxsize=PREFETCH_BATCHES,
     )
+    parsed_emails = []
+    # Workers start once the fetch thread is running, so don't fork them: a
+    # forked child could inherit a lock (e.g. stdout's) held by that thread
+    with ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context('spawn'),
+    ) as executor:
+      for housing_emails_batch in housing_emails_batches:
+        uids = [uid for uid, _ in housing_emails_batch]
+        raw_emails = [raw_email for _, raw_email in housing_emails_batch]
+        parsed_emails.extend(tqdm(
+            executor.map(
+                parse_housing_email_message_bytes, uids, raw_emails,
+                chunksize=4,
+            ),
+            total=len(housing_emails_batch),
+            desc='parse',
+            leave=False,
+            mininterval=0.5,
+            smoothing=0,
+        ))
     print(
-        f'Fetched {len(housing_emails)} gmail',
+        f'Fetched {len(parsed_emails)} new gmail',
         f'housing messages TO: {EMAIL_ADDRESS}',
         flush=True,
     )
-    emails = pd.DataFrame(
-        [parse_housing_email_message(e) for e in housing_emails]
-    )
-    emails = format_email_df(emails)
-    emails = emails.sort_values('Date', ascending=True) # oldest first
-    if SAVE_DEBUG_CACHE:
-      print(f'Saving email cache: {EMAIL_CACHE_FILE}')
-      emails.to_csv(EMAIL_CACHE_FILE, sep='\t', index=True)
-
-  # Pagination logic
-  n_pages = (len(emails) + N_ENTRIES_PER_HTML - 1) // N_ENTRIES_PER_HTML
+    if sync_state.get('uidvalidity') != cached_uidvalidity:
+      cached_emails = None  # Cached UIDs are no longer valid
+
+    emails = pd.DataFrame(parsed_emails)
+    if not emails.empty:
+      emails = format_email_df(emails)
+      emails = (
+          pd.concat([cached_emails, emails], ignore_index=True)
+          .drop_duplicates(subset='UID', keep='last')
+          .sort_values('Date', ascending=True)  # oldest first
+      )
+    elif cached_emails is not None:
+      emails = cached_emails
+    if USE_EMAIL_CACHE:
+      # The synced UID moves on every run, but the (HTML heavy) emails only
+      # change with new mail or when the cache was dropped
+      emails_changed = bool(parsed_emails) or cached_emails is None
+      _save_email_cache(emails if emails_changed else None, sync_state)
+
+  if emails.empty:  # No new emails and no (valid) cache
+    print('No housing emails to save to HTML', flush=True)
+    return
+
+  # Pagination logic. The DataFrame is only needed to merge and cache the
+  # emails, so pages are sliced from a plain list of their HTML
+  emails_html = emails['html'].tolist()
+  n_pages = (len(emails_html) + N_ENTRIES_PER_HTML - 1) // N_ENTRIES_PER_HTML
+  old_page_hashes, page_hashes = _load_page_hashes(), {}
+  n_written = 0
   for page in range(n_pages):
     start = page * N_ENTRIES_PER_HTML
-    end = min((page + 1) * N_ENTRIES_PER_HTML, len(emails))
-    subset = emails.iloc[start:end]
+    subset = emails_html[start:start + N_ENTRIES_PER_HTML]
     if page == 0:
       html_file = 'index.html'
     else:
       html_file = f'index{page}.html'
 
     header = _html_header(page, n_pages)
+    page_hashes[html_file] = _page_hash(subset, header)
+    if (page_hashes[html_file] == old_page_hashes.get(html_file)
+        and os.path.exists(html_file)):
+      os.utime(html_file)  # Unchanged since the last run
+      continue
     save_emails_to_html(subset, html_file, header)
+    n_written += 1
+  _save_page_hashes(page_hashes)
 
   print(
-      f'Parsed {len(emails)} housing emails in',
+      f'Parsed {len(emails_html)} housing emails in',
       f'{(time.time() - t0) / 60:0.1f} minutes and saved to',
-      f'{n_pages} HTML pages',
+      f'{n_pages} HTML pages ({n_written} changed)',
       flush=True,
   )
 